@@ -0,0 +1,25 @@
+"""
+FastAPI dependencies for the shared service instances.
+
+The services are created once in the application lifespan (see main.py)
+and stored on `app.state`; these helpers hand them to route handlers.
+"""
+from fastapi import Request
+from services.openrouter import OpenRouterService
+from services.sports_news import SportsNewsService
+from services.chat_history import ChatHistoryService
+
+
+def get_llm_service(request: Request) -> OpenRouterService:
+    """Get the shared OpenRouter service."""
+    return request.app.state.llm_service
+
+
+def get_sports_service(request: Request) -> SportsNewsService:
+    """Get the shared sports news service."""
+    return request.app.state.sports_service
+
+
+def get_history_service(request: Request) -> ChatHistoryService:
+    """Get the shared chat history service."""
+    return request.app.state.history_service
@@ -2,21 +2,36 @@
 Logging configuration for the application.
 
 Provides structured logging with proper error tracking and context.
+Records are handed to a background thread via a queue so that handler I/O
+never runs on the asyncio event loop.
 """
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
+from typing import Optional
 
+# Background listener that owns the real handlers (set by setup_logging)
+_listener: Optional[QueueListener] = None
 
-def setup_logging(log_level: str = "INFO", log_file: bool = True):
+
+def setup_logging(log_level: str = "INFO", log_file: bool = True, rotate: bool = True):
     """
     Configure application logging.
 
     Args:
         log_level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
         log_file: Whether to log to file in addition to console
+        rotate: Whether to rotate the log file by size. Rotation only works
+            when a single process writes the file; pass False when running
+            several workers, which then all append to the same file.
     """
+    global _listener
+
     # Create logs directory if it doesn't exist
     if log_file:
         log_dir = Path("logs")
@@ -27,7 +42,8 @@ def setup_logging(log_level: str = "INFO", log_file: bool = True):
     logger = logging.getLogger()
     logger.setLevel(getattr(logging, log_level.upper()))
 
-    # Remove existing handlers
+    # Stop a previous listener, if any, then remove existing handlers
+    shutdown_logging()
     logger.handlers = []
 
     # Console handler with formatting
@@ -38,22 +54,73 @@ def setup_logging(log_level: str = "INFO", log_file: bool = True):
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
+    handlers: list[logging.Handler] = [console_handler]
 
     # File handler with detailed formatting
     if log_file:
-        file_handler = logging.FileHandler(log_filename)
+        if rotate:
+            file_handler = RotatingFileHandler(
+                log_filename,
+                maxBytes=50 * 1024 * 1024,
+                backupCount=5,
+                encoding="utf-8",
+                delay=True
+            )
+        else:
+            file_handler = logging.FileHandler(log_filename, encoding="utf-8", delay=True)
         file_handler.setLevel(logging.DEBUG)
         file_formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+
+        # Batch records in memory so the file sees one write per ~1000 records
+        # (errors still flush immediately)
+        buffered_handler = MemoryHandler(
+            capacity=1024,
+            flushLevel=logging.ERROR,
+            target=file_handler
+        )
+        buffered_handler.setLevel(logging.DEBUG)
+        handlers.append(buffered_handler)
+
+    # The root logger only enqueues; the listener thread does the actual I/O
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
 
     return logger
 
 
+def shutdown_logging():
+    """
+    Stop the background log listener after draining queued records.
+
+    The listener's handlers are moved back onto the root logger so that
+    anything logged afterwards is still written (synchronously). Safe to
+    call more than once.
+    """
+    global _listener
+
+    if _listener is None:
+        return
+
+    listener, _listener = _listener, None
+    listener.stop()
+
+    root = logging.getLogger()
+    root.handlers = list(listener.handlers)
+    for handler in root.handlers:
+        handler.flush()
+
+
+# Make sure queued and buffered records reach their handlers on shutdown
+atexit.register(shutdown_logging)
+
+
+@lru_cache(maxsize=256)
 def get_logger(name: str) -> logging.Logger:
-    """Get a logger instance for a specific module."""
+    """Get a cached logger instance for a specific module."""
     return logging.getLogger(name)
@@ -1,25 +1,71 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from routers import chat, onboarding
+from services.openrouter import OpenRouterService
+from services.sports_news import SportsNewsService
+from services.chat_history import ChatHistoryService
 from config import get_settings
-from logging_config import setup_logging, get_logger
+from logging_config import setup_logging, shutdown_logging, get_logger
+import httpx
+import orjson
+import sys
 import uvicorn
 
-# Initialize logging
-setup_logging(log_level="INFO", log_file=True)
+# Initialize console logging. Importing this module also happens in the
+# reloader and worker-manager parents, so file logging is only set up in
+# the lifespan, which runs in the serving processes alone.
+setup_logging(log_level="INFO", log_file=False)
 logger = get_logger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared services on startup and release them on shutdown."""
+    # Size-based rotation is only safe when a single process writes the
+    # file; with several workers they all append to it instead
+    settings = get_settings()
+    setup_logging(
+        log_level="INFO",
+        log_file=True,
+        rotate=settings.dev_reload or settings.web_concurrency <= 1
+    )
+    logger.info("Application starting up...")
+
+    # One connection pool shared by every outbound API call
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=30.0,
+        limits=httpx.Limits(max_keepalive_connections=32)
+    )
+    app.state.http_client = http_client
+    app.state.llm_service = OpenRouterService(client=http_client)
+    app.state.sports_service = SportsNewsService(client=http_client)
+    app.state.history_service = ChatHistoryService()
+
+    yield
+
+    logger.info("Application shutting down...")
+    await app.state.llm_service.aclose()
+    await app.state.sports_service.aclose()
+    await http_client.aclose()
+    # Let saves from cancelled streams finish before the connection closes
+    await chat.wait_for_pending_saves()
+    app.state.history_service.close()
+    shutdown_logging()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Teach Me LeBron - Sports Lore Chatbot",
     description="A chatbot that helps you keep up with sports conversations in layman's terms",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
-logger.info("Application starting up...")
-
 # CORS middleware for development
 app.add_middleware(
     CORSMiddleware,
@@ -36,25 +82,38 @@ app.include_router(onboarding.router)
 # Serve static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# The landing page never changes at runtime, so read it once at startup
+with open("static/index.html", "rb") as f:
+    _INDEX_HTML = f.read()
+
+_HEALTH_JSON = orjson.dumps({"status": "healthy", "service": "teach-me-lebron"})
+
 
 @app.get("/")
 async def root():
     """Serve the main chat interface."""
-    return FileResponse("static/index.html")
+    return HTMLResponse(content=_INDEX_HTML)
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy", "service": "teach-me-lebron"}
+    return Response(content=_HEALTH_JSON, media_type="application/json")
 
 
 if __name__ == "__main__":
     settings = get_settings()
     logger.info(f"Starting server on {settings.host}:{settings.port}")
+    # Reload is for local development only (DEV_RELOAD=1); it runs a file
+    # watcher process and can't be combined with multiple workers.
+    # uvloop and httptools ship with uvicorn[standard] (uvloop is not
+    # available on Windows, which falls back to the stdlib asyncio loop).
     uvicorn.run(
         "main:app",
         host=settings.host,
         port=settings.port,
-        reload=True
+        reload=settings.dev_reload,
+        workers=None if settings.dev_reload else settings.web_concurrency,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools"
     )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 from enum import Enum
 
@@ -10,32 +10,33 @@ class TeamPreference(BaseModel):
     sport: str
     is_local: bool = False
 
+    model_config = ConfigDict(frozen=True)
+
 
 class UserPreferences(BaseModel):
     """User preferences including teams and location."""
     location: str = "Seattle"
     teams: List[TeamPreference] = []
 
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "location": "Seattle",
-                "teams": [
-                    {
-                        "team_name": "Seattle Mariners",
-                        "team_id": "12",
-                        "sport": "baseball",
-                        "is_local": True
-                    },
-                    {
-                        "team_name": "Seattle Seahawks",
-                        "team_id": "26",
-                        "sport": "football",
-                        "is_local": True
-                    }
-                ]
-            }
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "location": "Seattle",
+            "teams": [
+                {
+                    "team_name": "Seattle Mariners",
+                    "team_id": "12",
+                    "sport": "baseball",
+                    "is_local": True
+                },
+                {
+                    "team_name": "Seattle Seahawks",
+                    "team_id": "26",
+                    "sport": "football",
+                    "is_local": True
+                }
+            ]
         }
+    })
 
 
 class ChatMessage(BaseModel):
@@ -55,6 +56,8 @@ class NewsItem(BaseModel):
     link: Optional[str] = None
     published: Optional[str] = None
 
+    model_config = ConfigDict(frozen=True)
+
 
 class ChatMode(str, Enum):
     """Chat interaction mode."""
@@ -1,84 +1,87 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from models import ChatMessage, UserPreferences, ChatMode, SportsClip
 from services.openrouter import OpenRouterService
 from services.sports_news import SportsNewsService
 from services.clips_database import search_clips
 from services.chat_history import ChatHistoryService
+from dependencies import get_llm_service, get_sports_service, get_history_service
+from prompts import (
+    SPORTS_LORE_SYSTEM_PROMPT,
+    SPORTS_NEWS_SYSTEM_PROMPT,
+    NEWS_SUMMARY_INSTRUCTION,
+    CLIP_CONTEXT_NOTE,
+    NO_NEWS_MESSAGE,
+)
 from logging_config import get_logger
-import json
+import asyncio
+import orjson
 import httpx
+import re
 from typing import AsyncGenerator
 
 logger = get_logger(__name__)
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
-llm_service = OpenRouterService()
-sports_service = SportsNewsService()
-history_service = ChatHistoryService()
 
+# Messages containing any of these are treated as news requests
+_NEWS_KEYWORDS = ("news", "update", "happening", "latest", "recent", "what's new")
+_NEWS_RE = re.compile("|".join(map(re.escape, _NEWS_KEYWORDS)), re.IGNORECASE)
 
-SPORTS_LORE_SYSTEM_PROMPT = """You are a sports expert who explains sports concepts, history, and lore in simple, clear terms.
 
-Your goal is to help people who don't follow sports understand enough to participate in casual work conversations.
+def sse_frame(event: dict) -> bytes:
+    """Serialize an event dict into a single SSE `data:` frame."""
+    return b"data: " + orjson.dumps(event) + b"\n\n"
 
-Guidelines:
-- Explain things simply, avoiding jargon or explaining any jargon you use
-- Use analogies and comparisons to make concepts relatable
-- Keep responses concise but informative
-- Add context about why something matters or is significant
-- When relevant video clips are available, they will be shown automatically
 
-Your audience wants to blend in at work, not become sports analysts. Keep it simple and practical."""
+# Constant frames, serialized once at import instead of per stream
+_SSE_START = sse_frame({"type": "start"})
+_SSE_DONE = sse_frame({"type": "done"})
 
-SPORTS_NEWS_SYSTEM_PROMPT = """You are a sports news summarizer who presents important sports news in simple, conversational language.
 
-Your goal is to give busy people the key sports updates they need to know to chat with coworkers.
-
-Guidelines:
-- Summarize the news in 2-3 sentences per item
-- Explain WHY it matters (playoffs implications, rivalry, historic achievement, etc.)
-- Avoid technical jargon; use everyday language
-- Focus on what someone would actually talk about at work
-- For playoff news, explain what's at stake
-- For local team news, add local context
-
-Keep it brief, relatable, and conversational."""
-
-
-async def create_sse_stream(content: str) -> AsyncGenerator[str, None]:
-    """Create SSE formatted stream from static content."""
-    yield f"data: {json.dumps({'type': 'start'})}\n\n"
-
-    # Simulate token streaming for static content
+def build_sse_frames(content: str) -> list[bytes]:
+    """Build the complete list of SSE frames for static content."""
+    # Simulate token streaming for static content: one frame per word
     words = content.split()
+    frames = [_SSE_START]
     for i, word in enumerate(words):
         token = word if i == len(words) - 1 else word + " "
-        yield f"data: {json.dumps({'type': 'token', 'content': token})}\n\n"
+        frames.append(sse_frame({"type": "token", "content": token}))
+    frames.append(_SSE_DONE)
+    return frames
 
-    yield f"data: {json.dumps({'type': 'done'})}\n\n"
+
+# The "no news" reply never changes, so its frames are built once at import
+_NO_NEWS_FRAMES = build_sse_frames(NO_NEWS_MESSAGE)
 
 
 async def stream_llm_response(
+    llm_service: OpenRouterService,
     messages: list[dict],
     system_prompt: str,
-    clips: list[dict] = None
-) -> AsyncGenerator[str, None]:
-    """Stream LLM response as SSE events, optionally including video clips."""
-    yield f"data: {json.dumps({'type': 'start'})}\n\n"
+    clips: list[dict] = None,
+    sink: list[str] | None = None
+) -> AsyncGenerator[bytes, None]:
+    """
+    Stream LLM response as SSE events, optionally including video clips.
+
+    If `sink` is given, each token is appended to it as it is produced so
+    callers can recover the full text without re-parsing the SSE frames.
+    """
+    yield _SSE_START
 
-    full_response = ""
     try:
         async for token in llm_service.stream_chat_completion(messages, system_prompt):
-            full_response += token
-            yield f"data: {json.dumps({'type': 'token', 'content': token})}\n\n"
+            if sink is not None:
+                sink.append(token)
+            yield sse_frame({"type": "token", "content": token})
 
         # After text is done, send clips if any
         if clips:
             for clip in clips:
-                yield f"data: {json.dumps({'type': 'clip', 'clip': clip})}\n\n"
+                yield sse_frame({"type": "clip", "clip": clip})
 
-        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+        yield _SSE_DONE
 
     except httpx.HTTPStatusError as e:
         logger.error(f"HTTP error in stream_llm_response: {e.response.status_code}")
@@ -88,45 +91,89 @@ async def stream_llm_response(
             error_msg = "API authentication failed. Please check your OpenRouter API key."
         else:
             error_msg = f"API error ({e.response.status_code}). Please try again."
-        yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
+        yield sse_frame({"type": "error", "content": error_msg})
     except httpx.RequestError as e:
         logger.error(f"Request error in stream_llm_response: {str(e)}")
         error_msg = "Network error. Please check your connection and try again."
-        yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
+        yield sse_frame({"type": "error", "content": error_msg})
     except Exception as e:
         logger.error(f"Unexpected error in stream_llm_response: {str(e)}", exc_info=True)
         error_msg = f"An unexpected error occurred: {str(e)}"
-        yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
+        yield sse_frame({"type": "error", "content": error_msg})
+
+
+# History saves still running after their stream was cancelled
+_pending_saves: set[asyncio.Task] = set()
+
+
+def _finish_save(task: asyncio.Task):
+    """Forget a finished history save, logging it if it failed."""
+    _pending_saves.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Failed to save chat turn to history", exc_info=task.exception())
+
+
+async def save_turn(
+    history_service: ChatHistoryService,
+    user_id: str,
+    turn: list[tuple]
+):
+    """
+    Save a chat turn to history, even if the caller is being cancelled.
+
+    A client disconnect cancels the streaming generator; the save runs as
+    its own shielded task so it still completes.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(history_service.add_messages, user_id, turn))
+    _pending_saves.add(task)
+    task.add_done_callback(_finish_save)
+    await asyncio.shield(task)
+
+
+async def wait_for_pending_saves():
+    """Wait for any history saves still running (e.g. before shutdown)."""
+    if _pending_saves:
+        await asyncio.gather(*_pending_saves, return_exceptions=True)
 
 
 async def stream_with_history(
+    llm_service: OpenRouterService,
+    history_service: ChatHistoryService,
     user_id: str,
     user_message: str,
-    generator: AsyncGenerator[str, None],
+    messages: list[dict],
+    system_prompt: str,
     clips: list[dict] = None
-) -> AsyncGenerator[str, None]:
-    """Wrapper that saves chat history while streaming."""
-    full_response = ""
-
-    async for chunk in generator:
-        # Extract content from SSE data if present
-        if chunk.startswith("data: "):
-            try:
-                data = json.loads(chunk[6:])
-                if data.get("type") == "token" and "content" in data:
-                    full_response += data["content"]
-            except:
-                pass
-        yield chunk
-
-    # Save to history after streaming is complete
-    if full_response:
-        history_service.add_message(user_id, "assistant", full_response, clips)
-        logger.debug(f"Saved assistant response to history for user {user_id}")
+) -> AsyncGenerator[bytes, None]:
+    """
+    Stream an LLM response, then save the user's message and the response
+    to chat history together once the stream is complete.
+
+    If the client disconnects mid-stream, the user's message and whatever
+    part of the response was generated are still saved.
+    """
+    sink: list[str] = []
+
+    try:
+        async for chunk in stream_llm_response(llm_service, messages, system_prompt, clips=clips, sink=sink):
+            yield chunk
+    finally:
+        # Save to history after streaming is complete (or was cut off)
+        turn = [("user", user_message, None)]
+        full_response = "".join(sink)
+        if full_response:
+            turn.append(("assistant", full_response, clips))
+        await save_turn(history_service, user_id, turn)
+        logger.debug("Saved chat turn to history for user %s", user_id)
 
 
 @router.post("/stream")
-async def chat_stream(chat_message: ChatMessage):
+async def chat_stream(
+    chat_message: ChatMessage,
+    llm_service: OpenRouterService = Depends(get_llm_service),
+    sports_service: SportsNewsService = Depends(get_sports_service),
+    history_service: ChatHistoryService = Depends(get_history_service)
+):
     """
     Main chat endpoint with SSE streaming.
 
@@ -137,20 +184,13 @@ async def chat_stream(chat_message: ChatMessage):
     user_id = chat_message.user_id
     logger.info(f"Chat stream request from user {user_id}: {chat_message.message[:50]}...")
 
-    # Save user message to history
-    history_service.add_message(user_id, "user", chat_message.message)
-
     # Get user preferences (use defaults if not provided)
     preferences = chat_message.preferences
-    if not preferences:
+    if preferences is None:
         preferences = sports_service.get_default_preferences("Seattle")
 
     # Detect if this is a request for news or a question
-    message_lower = chat_message.message.lower()
-    is_news_request = any(
-        keyword in message_lower
-        for keyword in ["news", "update", "happening", "latest", "recent", "what's new"]
-    )
+    is_news_request = _NEWS_RE.search(chat_message.message) is not None
 
     if is_news_request:
         # Proactive mode: Fetch and summarize news
@@ -159,10 +199,13 @@ async def chat_stream(chat_message: ChatMessage):
 
         if not news_items:
             async def no_news_stream():
-                content = "There's no major news right now for your teams. All quiet on the sports front! Check back later or ask me anything about sports history and lore."
-                history_service.add_message(user_id, "assistant", content)
-                async for chunk in create_sse_stream(content):
-                    yield chunk
+                await save_turn(
+                    history_service,
+                    user_id,
+                    [("user", chat_message.message, None), ("assistant", NO_NEWS_MESSAGE, None)]
+                )
+                for frame in _NO_NEWS_FRAMES:
+                    yield frame
 
             return StreamingResponse(
                 no_news_stream(),
@@ -170,26 +213,30 @@ async def chat_stream(chat_message: ChatMessage):
             )
 
         # Format news for LLM
-        news_summary = "Here are the latest important sports updates:\n\n"
+        parts = ["Here are the latest important sports updates:\n\n"]
         for item in news_items:
-            news_summary += f"**{item.team}** ({item.sport.upper()}) - {item.importance.upper()}\n"
-            news_summary += f"Headline: {item.title}\n"
+            parts.append(f"**{item.team}** ({item.sport.upper()}) - {item.importance.upper()}\n")
+            parts.append(f"Headline: {item.title}\n")
             if item.description:
-                news_summary += f"Details: {item.description}\n"
-            news_summary += "\n"
+                parts.append(f"Details: {item.description}\n")
+            parts.append("\n")
+        news_summary = "".join(parts)
 
         messages = [
             {
                 "role": "user",
-                "content": f"Please summarize this sports news in a friendly, easy-to-understand way:\n\n{news_summary}"
+                "content": NEWS_SUMMARY_INSTRUCTION + news_summary
             }
         ]
 
         return StreamingResponse(
             stream_with_history(
+                llm_service,
+                history_service,
                 user_id,
                 chat_message.message,
-                stream_llm_response(messages, SPORTS_NEWS_SYSTEM_PROMPT)
+                messages,
+                SPORTS_NEWS_SYSTEM_PROMPT
             ),
             media_type="text/event-stream"
         )
@@ -199,19 +246,18 @@ async def chat_stream(chat_message: ChatMessage):
         logger.debug("Processing as Q&A request")
 
         # Get conversation history for context
-        conversation_history = history_service.get_context_for_llm(user_id, max_messages=8)
-        logger.debug(f"Loaded {len(conversation_history)} messages from history for context")
+        conversation_history = await asyncio.to_thread(history_service.get_context_for_llm, user_id, 8)
+        logger.debug("Loaded %d messages from history for context", len(conversation_history))
 
         # Search for relevant clips
         relevant_clips = search_clips(chat_message.message, max_results=2)
         if relevant_clips:
-            logger.debug(f"Found {len(relevant_clips)} relevant clips")
+            logger.debug("Found %d relevant clips", len(relevant_clips))
 
         # Add clip context to the current message if found
         current_message = chat_message.message
         if relevant_clips:
-            clip_context = "\n\n[Note: Relevant video clips are available and will be shown to the user automatically]"
-            current_message += clip_context
+            current_message += CLIP_CONTEXT_NOTE
 
         # Combine history with current message
         messages = conversation_history + [
@@ -223,17 +269,23 @@ async def chat_stream(chat_message: ChatMessage):
 
         return StreamingResponse(
             stream_with_history(
+                llm_service,
+                history_service,
                 user_id,
                 chat_message.message,
-                stream_llm_response(messages, SPORTS_LORE_SYSTEM_PROMPT, clips=relevant_clips),
+                messages,
+                SPORTS_LORE_SYSTEM_PROMPT,
                 clips=relevant_clips
             ),
             media_type="text/event-stream"
         )
 
 
-@router.post("/check-news")
-async def check_proactive_news(preferences: UserPreferences):
+@router.post("/check-news", response_model=None)
+async def check_proactive_news(
+    preferences: UserPreferences,
+    sports_service: SportsNewsService = Depends(get_sports_service)
+):
     """
     Check if there's important news to proactively share.
 
@@ -241,15 +293,19 @@ async def check_proactive_news(preferences: UserPreferences):
     """
     should_notify, news_items = await sports_service.check_for_proactive_news(preferences)
 
-    return {
+    return ORJSONResponse({
         "should_notify": should_notify,
         "news_count": len(news_items),
-        "news_items": news_items
-    }
+        "news_items": [item.model_dump() for item in news_items]
+    })
 
 
-@router.get("/history/{user_id}")
-async def get_chat_history(user_id: str, limit: int = 50):
+@router.get("/history/{user_id}", response_model=None)
+async def get_chat_history(
+    user_id: str,
+    limit: int = 50,
+    history_service: ChatHistoryService = Depends(get_history_service)
+):
     """
     Get chat history for a user.
 
@@ -260,27 +316,31 @@ async def get_chat_history(user_id: str, limit: int = 50):
     Returns:
         List of messages with role, content, clips, and timestamp
     """
-    logger.debug(f"Fetching chat history for user {user_id}, limit {limit}")
+    logger.debug("Fetching chat history for user %s, limit %d", user_id, limit)
 
     try:
-        history = history_service.get_conversation_history(
+        history = await asyncio.to_thread(
+            history_service.get_conversation_history,
             user_id,
             limit=limit,
             include_clips=True
         )
 
-        return {
+        return ORJSONResponse({
             "user_id": user_id,
             "messages": history,
             "total": len(history)
-        }
+        })
     except Exception as e:
         logger.error(f"Error fetching chat history: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch chat history")
 
 
 @router.delete("/history/{user_id}")
-async def clear_chat_history(user_id: str):
+async def clear_chat_history(
+    user_id: str,
+    history_service: ChatHistoryService = Depends(get_history_service)
+):
     """
     Clear all chat history for a user.
 
@@ -293,7 +353,7 @@ async def clear_chat_history(user_id: str):
     logger.info(f"Clearing chat history for user {user_id}")
 
     try:
-        deleted_count = history_service.clear_history(user_id)
+        deleted_count = await asyncio.to_thread(history_service.clear_history, user_id)
 
         return {
             "user_id": user_id,
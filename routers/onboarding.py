@@ -1,14 +1,25 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from models import UserPreferences, TeamPreference
 from services.sports_news import SportsNewsService
-from typing import List
+from dependencies import get_sports_service
+import orjson
 
 router = APIRouter(prefix="/api/onboarding", tags=["onboarding"])
-sports_service = SportsNewsService()
+
+# Constant payload, serialized once so requests skip FastAPI's encoder
+_AVAILABLE_LOCATIONS_JSON = orjson.dumps([
+    {
+        "name": "Seattle",
+        "teams": ["Seattle Mariners (MLB)", "Seattle Seahawks (NFL)"]
+    }
+])
 
 
 @router.get("/default-teams/{location}")
-async def get_default_teams(location: str) -> UserPreferences:
+async def get_default_teams(
+    location: str,
+    sports_service: SportsNewsService = Depends(get_sports_service)
+) -> UserPreferences:
     """
     Get default team preferences for a location.
 
@@ -42,11 +53,6 @@ async def save_preferences(preferences: UserPreferences) -> dict:
 
 
 @router.get("/available-locations")
-async def get_available_locations() -> List[dict]:
+async def get_available_locations():
     """Get list of available locations with team coverage."""
-    return [
-        {
-            "name": "Seattle",
-            "teams": ["Seattle Mariners (MLB)", "Seattle Seahawks (NFL)"]
-        }
-    ]
+    return Response(content=_AVAILABLE_LOCATIONS_JSON, media_type="application/json")
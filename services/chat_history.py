@@ -4,46 +4,228 @@ Chat history management with SQLite database.
 Provides conversation persistence and retrieval with context window management.
 """
 import sqlite3
+import threading
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from pathlib import Path
-import json
+import orjson
+from services.clips_database import get_clip_by_id
 from logging_config import get_logger
 
 logger = get_logger(__name__)
 
+# Role of the synthetic rows that summarize messages dropped from context
+SUMMARY_ROLE = "summary"
+
+# Summaries keep only this many per-message bullets, each clipped to a snippet,
+# plus the user's first message clipped to a longer snippet. This bounds a
+# summary to roughly 5k characters, well under the context token budget.
+_MAX_SUMMARY_BULLETS = 20
+_SUMMARY_SNIPPET_CHARS = 200
+_SUMMARY_FIRST_MESSAGE_CHARS = 500
+_SUMMARY_HEADER = "Summary of the earlier conversation:"
+_SUMMARY_FIRST_MESSAGE_PREFIX = "The user's first message was: "
+
+# Hot-path statements. sqlite3 keeps compiled statements in a per-connection
+# cache keyed by SQL text, so each is parsed and planned only once as long as
+# the exact same string is passed every time.
+_INSERT_MESSAGE_SQL = (
+    "INSERT INTO messages (user_id, role, content) VALUES (?, ?, ?)"
+)
+_INSERT_MESSAGE_CLIP_SQL = (
+    "INSERT INTO message_clips (message_id, clip_id, position) VALUES (?, ?, ?)"
+)
+# The inner query walks the index newest-first to find the last N messages;
+# the outer one hands them back oldest-first, so no reversal is needed.
+# Clips are only looked up when the caller asks for them.
+_SELECT_HISTORY_TEMPLATE = """
+    SELECT role, content, created_at{outer_columns} FROM (
+        SELECT id, role, content, created_at{inner_columns}
+        FROM messages
+        WHERE user_id = ? AND role != ?
+        ORDER BY id DESC
+        LIMIT ?
+    )
+    ORDER BY id ASC
+"""
+_SELECT_HISTORY_SQL = _SELECT_HISTORY_TEMPLATE.format(outer_columns="", inner_columns="")
+_SELECT_HISTORY_WITH_CLIPS_SQL = _SELECT_HISTORY_TEMPLATE.format(
+    outer_columns=", clips, clip_ids",
+    inner_columns=""", clips, (
+            SELECT group_concat(clip_id, ',') FROM (
+                SELECT clip_id FROM message_clips
+                WHERE message_id = messages.id
+                ORDER BY position
+            )
+        ) AS clip_ids"""
+)
+_SELECT_ANCHOR_SQL = "SELECT anchor_id FROM context_windows WHERE user_id = ?"
+_SELECT_NEW_ANCHOR_SQL = """
+    SELECT MIN(id) FROM (
+        SELECT id FROM messages
+        WHERE user_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    )
+"""
+_SELECT_WINDOW_SQL = """
+    SELECT id, role, content
+    FROM messages
+    WHERE user_id = ? AND id >= ? AND role != ?
+    ORDER BY id ASC
+"""
+_SELECT_SUMMARY_SQL = """
+    SELECT id, content FROM messages
+    WHERE user_id = ? AND role = ?
+    ORDER BY id DESC
+    LIMIT 1
+"""
+_UPSERT_ANCHOR_SQL = """
+    INSERT INTO context_windows (user_id, anchor_id) VALUES (?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET anchor_id = excluded.anchor_id
+"""
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about four characters per token)."""
+    return len(text) // 4
+
+
+def _snippet(text: str, max_chars: int) -> str:
+    """Collapse all whitespace (including newlines) and clip to max_chars."""
+    return " ".join(text.split())[:max_chars]
+
+
+def _build_summary(previous: Optional[str], rows: List) -> str:
+    """
+    Fold dropped messages into a plain-text summary, without an LLM call.
+
+    The user's first message is kept as a long snippet (it usually states
+    who they are and what they care about); every later message becomes a
+    short bullet, and only the most recent bullets are kept.
+
+    Every part is collapsed onto a single line, so a previous summary is
+    split back into its header lines and bullets by position.
+    """
+    if previous:
+        lines = previous.split("\n")
+        header_size = 2 if lines[1:2] and lines[1].startswith(_SUMMARY_FIRST_MESSAGE_PREFIX) else 1
+        header, bullets = lines[:header_size], lines[header_size:]
+    else:
+        header, bullets = [_SUMMARY_HEADER], []
+        first_user = next((row["content"] for row in rows if row["role"] == "user"), None)
+        if first_user:
+            header.append(
+                _SUMMARY_FIRST_MESSAGE_PREFIX + _snippet(first_user, _SUMMARY_FIRST_MESSAGE_CHARS)
+            )
+
+    for row in rows:
+        bullets.append(f"- {row['role']}: {_snippet(row['content'], _SUMMARY_SNIPPET_CHARS)}")
+
+    return "\n".join(header + bullets[-_MAX_SUMMARY_BULLETS:])
+
+
+def _clips_from_ids(clip_ids: str) -> List[Dict]:
+    """Rebuild clip dicts from a comma-separated list of clip ids."""
+    clips = []
+    for clip_id in clip_ids.split(","):
+        clip = get_clip_by_id(clip_id)
+        if clip is not None:  # skip clips since removed from the database
+            clips.append({"clip_id": clip_id, **clip})
+    return clips
+
+
+def _llm_row(cursor: sqlite3.Cursor, row: tuple) -> Tuple[int, Dict[str, str]]:
+    """Row factory for context window rows: (id, {role, content})."""
+    return row[0], {"role": row[1], "content": row[2]}
+
 
 class ChatHistoryService:
     """Service for managing chat conversation history."""
 
-    def __init__(self, db_path: str = "data/chat_history.db"):
-        """Initialize the chat history service with SQLite database."""
+    def __init__(
+        self,
+        db_path: str = "data/chat_history.db",
+        context_window_tokens: int = 8192
+    ):
+        """
+        Initialize the chat history service with SQLite database.
+
+        Args:
+            db_path: Path to the SQLite database file
+            context_window_tokens: Model context size; LLM history is
+                summarized once it would use more than 80% of this
+        """
         self.db_path = db_path
+        self.context_token_budget = int(context_window_tokens * 0.8)
 
         # Create data directory if it doesn't exist
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
 
+        # One long-lived connection in autocommit mode, shared by all threads
+        # (calls arrive from asyncio.to_thread workers) and guarded by a lock
+        self._conn = sqlite3.connect(
+            db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+
+        self._configure_connection()
         self._init_database()
         logger.info(f"ChatHistoryService initialized with database at {db_path}")
 
+    def _configure_connection(self):
+        """Apply connection-level pragmas for a write-ahead-logged database."""
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA temp_store=MEMORY")
+            self._conn.execute("PRAGMA cache_size=-65536")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
     def _init_database(self):
         """Initialize the database schema."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._lock:
+            cursor = self._conn.cursor()
 
-            # Create messages table
+            # Create messages table (the clips column only holds JSON from
+            # older databases; clips now live in message_clips)
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS messages (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id TEXT NOT NULL,
                     role TEXT NOT NULL,
                     content TEXT NOT NULL,
-                    clips TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    INDEX idx_user_created (user_id, created_at)
+                    clips BLOB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Clips shown with a message, by id into the static clips database
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS message_clips (
+                    message_id INTEGER NOT NULL
+                        REFERENCES messages (id) ON DELETE CASCADE,
+                    clip_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (message_id, position)
                 )
             """)
 
+            # Per-user lookups walk this index newest-first with no sort step
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_messages_user_id
+                ON messages (user_id, id DESC)
+            """)
+
             # Create sessions table for tracking conversations
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS sessions (
@@ -54,7 +236,14 @@ class ChatHistoryService:
                 )
             """)
 
-            conn.commit()
+            # First message id of each user's current LLM context window
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS context_windows (
+                    user_id TEXT PRIMARY KEY,
+                    anchor_id INTEGER NOT NULL
+                )
+            """)
+
             logger.debug("Database schema initialized")
 
     def add_message(
@@ -76,23 +265,61 @@ class ChatHistoryService:
         Returns:
             Message ID
         """
-        clips_json = json.dumps(clips) if clips else None
-
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO messages (user_id, role, content, clips)
-                VALUES (?, ?, ?, ?)
-                """,
-                (user_id, role, content, clips_json)
-            )
-            message_id = cursor.lastrowid
-            conn.commit()
-
-            logger.debug(f"Added {role} message for user {user_id}: {content[:50]}...")
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                message_id = self._insert_message(user_id, role, content, clips)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+            logger.debug("Added %s message for user %s: %s...", role, user_id, content[:50])
             return message_id
 
+    def add_messages(
+        self,
+        user_id: str,
+        messages: List[Tuple[str, str, Optional[List[Dict]]]]
+    ) -> None:
+        """
+        Add several messages to chat history in a single transaction.
+
+        Args:
+            user_id: User identifier
+            messages: (role, content, clips) tuples, in chronological order
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for role, content, clips in messages:
+                    self._insert_message(user_id, role, content, clips)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+            logger.debug("Added %d messages for user %s", len(messages), user_id)
+
+    def _insert_message(
+        self,
+        user_id: str,
+        role: str,
+        content: str,
+        clips: Optional[List[Dict]]
+    ) -> int:
+        """Insert one message and its clip references (caller holds the lock)."""
+        message_id = self._conn.execute(
+            _INSERT_MESSAGE_SQL,
+            (user_id, role, content)
+        ).lastrowid
+        if clips:
+            self._conn.executemany(
+                _INSERT_MESSAGE_CLIP_SQL,
+                [(message_id, clip["clip_id"], i) for i, clip in enumerate(clips)]
+            )
+        return message_id
+
     def get_conversation_history(
         self,
         user_id: str,
@@ -110,39 +337,29 @@ class ChatHistoryService:
         Returns:
             List of message dictionaries with role, content, and optional clips
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            cursor.execute(
-                """
-                SELECT role, content, clips, created_at
-                FROM messages
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT ?
-                """,
-                (user_id, limit)
-            )
+        sql = _SELECT_HISTORY_WITH_CLIPS_SQL if include_clips else _SELECT_HISTORY_SQL
 
-            messages = []
-            for row in cursor.fetchall():
+        messages = []
+        with self._lock:
+            # Build the result straight from the cursor, already in order
+            for row in self._conn.execute(sql, (user_id, SUMMARY_ROLE, limit)):
                 message = {
                     "role": row["role"],
                     "content": row["content"],
                     "created_at": row["created_at"]
                 }
 
-                if include_clips and row["clips"]:
-                    message["clips"] = json.loads(row["clips"])
+                if include_clips:
+                    if row["clip_ids"]:
+                        message["clips"] = _clips_from_ids(row["clip_ids"])
+                    elif row["clips"]:
+                        # Inline JSON (BLOB or TEXT) from older databases
+                        message["clips"] = orjson.loads(row["clips"])
 
                 messages.append(message)
 
-            # Reverse to get chronological order
-            messages.reverse()
-
-            logger.debug(f"Retrieved {len(messages)} messages for user {user_id}")
-            return messages
+        logger.debug("Retrieved %d messages for user %s", len(messages), user_id)
+        return messages
 
     def get_context_for_llm(
         self,
@@ -152,26 +369,93 @@ class ChatHistoryService:
         """
         Get conversation context formatted for LLM API.
 
-        Returns messages in the format needed for OpenRouter API,
-        limiting to recent messages to stay within context window.
+        Returns messages in the format needed for OpenRouter API. Instead of
+        a sliding window (whose start moves every turn), the window starts at
+        a stored anchor message and grows, so consecutive requests share an
+        identical message prefix that provider-side prompt caches can reuse.
+        Once the window exceeds 2 * max_messages, the anchor jumps forward to
+        keep only the most recent max_messages. If the window would exceed
+        the token budget, its older half is dropped as well.
+
+        Dropped messages aren't forgotten: they are folded into the user's
+        summary row (one per user, updated in place) that is sent ahead of
+        the window as a system message.
 
         Args:
             user_id: User identifier
-            max_messages: Maximum number of recent messages to include
+            max_messages: Number of recent messages to keep when the window
+                is reset (the window holds up to twice this many)
 
         Returns:
             List of dicts with 'role' and 'content' keys
         """
-        messages = self.get_conversation_history(user_id, limit=max_messages)
+        with self._lock:
+            anchor = self._conn.execute(_SELECT_ANCHOR_SQL, (user_id,)).fetchone()
+
+            if anchor is None:
+                # New window: start at the max_messages-th most recent message
+                row = self._conn.execute(
+                    _SELECT_NEW_ANCHOR_SQL,
+                    (user_id, max_messages)
+                ).fetchone()
+                anchor_id = row[0] or 0
+            else:
+                anchor_id = anchor[0]
+
+            rows = self._get_llm_rows(user_id, anchor_id)
+
+            summary_row = self._conn.execute(
+                _SELECT_SUMMARY_SQL,
+                (user_id, SUMMARY_ROLE)
+            ).fetchone()
+            summary = summary_row[1] if summary_row else None
+
+            dropped = []
+            if len(rows) > 2 * max_messages:
+                dropped, rows = rows[:-max_messages], rows[-max_messages:]
+
+            window_tokens = sum(_estimate_tokens(message["content"]) for _, message in rows)
+            if summary:
+                window_tokens += _estimate_tokens(summary)
+            if window_tokens > self.context_token_budget and len(rows) > 1:
+                half = len(rows) // 2
+                dropped, rows = dropped + rows[:half], rows[half:]
+
+            if dropped:
+                summary = _build_summary(summary, [message for _, message in dropped])
+                if summary_row is None:
+                    self._conn.execute(
+                        _INSERT_MESSAGE_SQL,
+                        (user_id, SUMMARY_ROLE, summary)
+                    )
+                else:
+                    self._conn.execute(
+                        "UPDATE messages SET content = ? WHERE id = ?",
+                        (summary, summary_row[0])
+                    )
+                anchor_id = rows[0][0]
+                logger.debug("Summarized %d older messages for user %s", len(dropped), user_id)
+
+            if anchor is None or anchor[0] != anchor_id:
+                self._conn.execute(_UPSERT_ANCHOR_SQL, (user_id, anchor_id))
+
+            llm_messages = [message for _, message in rows]
+            if summary:
+                llm_messages.insert(0, {"role": "system", "content": summary})
+
+        logger.debug("Prepared %d messages as LLM context for user %s", len(llm_messages), user_id)
+        return llm_messages
 
-        # Format for LLM API (only role and content)
-        llm_messages = [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in messages
-        ]
+    def _get_llm_rows(self, user_id: str, anchor_id: int) -> List[Tuple[int, Dict[str, str]]]:
+        """
+        Fetch a user's context window as (id, message) pairs (caller holds the lock).
 
-        logger.debug(f"Prepared {len(llm_messages)} messages as LLM context for user {user_id}")
-        return llm_messages
+        The message dicts are built by the row factory straight from the
+        projected columns, already in the format needed for the LLM API.
+        """
+        cursor = self._conn.cursor()
+        cursor.row_factory = _llm_row
+        return cursor.execute(_SELECT_WINDOW_SQL, (user_id, anchor_id, SUMMARY_ROLE)).fetchall()
 
     def clear_history(self, user_id: str) -> int:
         """
@@ -181,27 +465,32 @@ class ChatHistoryService:
             user_id: User identifier
 
         Returns:
-            Number of messages deleted
+            Number of messages deleted (not counting the context summary)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM messages WHERE user_id = ?",
-                (user_id,)
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM messages WHERE user_id = ? AND role != ?",
+                (user_id, SUMMARY_ROLE)
             )
             deleted_count = cursor.rowcount
-            conn.commit()
+            self._conn.execute(
+                "DELETE FROM messages WHERE user_id = ? AND role = ?",
+                (user_id, SUMMARY_ROLE)
+            )
+            self._conn.execute(
+                "DELETE FROM context_windows WHERE user_id = ?",
+                (user_id,)
+            )
 
             logger.info(f"Cleared {deleted_count} messages for user {user_id}")
             return deleted_count
 
     def get_message_count(self, user_id: str) -> int:
         """Get total message count for a user."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT COUNT(*) FROM messages WHERE user_id = ?",
-                (user_id,)
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE user_id = ? AND role != ?",
+                (user_id, SUMMARY_ROLE)
             )
             count = cursor.fetchone()[0]
             return count
@@ -8,6 +8,12 @@ Each clip has:
 - youtube_id: YouTube video ID
 - timestamp: optional timestamp to start at
 """
+from functools import lru_cache
+
+try:
+    import ahocorasick
+except ImportError:  # optional; fall back to a plain scan of the keyword index
+    ahocorasick = None
 
 INFAMOUS_CLIPS = {
     "kawhi_bounce": {
@@ -146,26 +152,66 @@ INFAMOUS_CLIPS = {
 }
 
 
+# Keyword lists never change after load; store them as tuples so the
+# clip records handed out by search_clips can't be mutated by callers
+for _clip_data in INFAMOUS_CLIPS.values():
+    _clip_data["keywords"] = tuple(_clip_data["keywords"])
+
+# Inverted index: keyword -> ids of the clips it triggers
+KEYWORD_TO_CLIPS: dict[str, list[str]] = {}
+for _clip_id, _clip_data in INFAMOUS_CLIPS.items():
+    for _keyword in _clip_data["keywords"]:
+        KEYWORD_TO_CLIPS.setdefault(_keyword, []).append(_clip_id)
+
+# Sorted, de-duplicated keywords across all clips
+_ALL_KEYWORDS: tuple[str, ...] = tuple(sorted(KEYWORD_TO_CLIPS))
+
+# Position of each clip, so results keep the database's ordering
+_CLIP_ORDER = {clip_id: i for i, clip_id in enumerate(INFAMOUS_CLIPS)}
+
+# One automaton matches every keyword in a single pass over the query
+if ahocorasick is not None:
+    _KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for _keyword, _clip_ids in KEYWORD_TO_CLIPS.items():
+        _KEYWORD_AUTOMATON.add_word(_keyword, _clip_ids)
+    _KEYWORD_AUTOMATON.make_automaton()
+else:
+    _KEYWORD_AUTOMATON = None
+
+
+def _matching_clip_ids(query_lower: str) -> set[str]:
+    """Find the ids of all clips with a keyword contained in the query."""
+    matched = set()
+
+    if _KEYWORD_AUTOMATON is not None:
+        for _end, clip_ids in _KEYWORD_AUTOMATON.iter(query_lower):
+            matched.update(clip_ids)
+    else:
+        for keyword, clip_ids in KEYWORD_TO_CLIPS.items():
+            if keyword in query_lower:
+                matched.update(clip_ids)
+
+    return matched
+
+
 def search_clips(query: str, max_results: int = 3) -> list[dict]:
     """
     Search for clips based on query string.
 
     Returns list of matching clips with their metadata.
     """
-    query_lower = query.lower()
-    matches = []
+    return list(_search_clips_cached(query.strip().lower(), max_results))
 
-    for clip_id, clip_data in INFAMOUS_CLIPS.items():
-        # Check if any keyword matches
-        for keyword in clip_data["keywords"]:
-            if keyword in query_lower:
-                matches.append({
-                    "clip_id": clip_id,
-                    **clip_data
-                })
-                break
 
-    return matches[:max_results]
+@lru_cache(maxsize=1024)
+def _search_clips_cached(query_lower: str, max_results: int) -> tuple[dict, ...]:
+    """Memoized clip search over an already-normalized query."""
+    clip_ids = sorted(_matching_clip_ids(query_lower), key=_CLIP_ORDER.__getitem__)
+
+    return tuple(
+        {"clip_id": clip_id, **INFAMOUS_CLIPS[clip_id]}
+        for clip_id in clip_ids[:max_results]
+    )
 
 
 def get_clip_by_id(clip_id: str) -> dict | None:
@@ -173,9 +219,6 @@ def get_clip_by_id(clip_id: str) -> dict | None:
     return INFAMOUS_CLIPS.get(clip_id)
 
 
-def get_all_clip_keywords() -> list[str]:
+def get_all_clip_keywords() -> tuple[str, ...]:
     """Get all keywords across all clips for LLM context."""
-    keywords = set()
-    for clip_data in INFAMOUS_CLIPS.values():
-        keywords.update(clip_data["keywords"])
-    return sorted(list(keywords))
+    return _ALL_KEYWORDS
@@ -1,99 +1,137 @@
 import httpx
-import json
-from typing import AsyncGenerator
+import orjson
+from typing import AsyncGenerator, Optional
 from config import get_settings
 from logging_config import get_logger
 
 logger = get_logger(__name__)
 
+# Statuses with a dedicated explanation: status -> (log message, error message)
+_STATUS_ERRORS = {
+    429: (
+        "Rate limit exceeded (429) for OpenRouter API. Model: {model}",
+        "Rate limit exceeded. Please try again in a moment."
+    ),
+    401: (
+        "Authentication failed (401) - Invalid API key",
+        "Invalid API key. Please check your OpenRouter credentials."
+    ),
+}
+
 
 class OpenRouterService:
     """Service for interacting with OpenRouter API for LLM calls."""
 
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        """
+        Args:
+            client: Shared HTTP client to send requests through. A private
+                pooled HTTP/2 client is created (and owned) if none is given.
+        """
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            http2=True,
+            timeout=60.0,
+            limits=httpx.Limits(max_keepalive_connections=32)
+        )
         self.settings = get_settings()
         self.base_url = self.settings.openrouter_base_url
         self.api_key = self.settings.openrouter_api_key
         self.model = self.settings.openrouter_model
+        # Request headers never change, so build them once
+        self._static_headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "https://github.com/teach-me-lebron",
+            "X-Title": "Teach Me LeBron - Sports Lore Chatbot",
+            "Content-Type": "application/json"
+        }
         logger.info(f"OpenRouterService initialized with model: {self.model}")
 
+    async def aclose(self):
+        """Close the HTTP client if this service created it."""
+        if self._owns_client:
+            await self.client.aclose()
+
+    def _build_messages(
+        self,
+        messages: list[dict],
+        system_prompt: Optional[str],
+        dynamic_context: Optional[str]
+    ) -> list[dict]:
+        """
+        Assemble the request messages with a stable prefix.
+
+        The static system prompt always comes first and is byte-identical
+        across requests, so provider-side prompt caches can reuse it; any
+        per-request context follows as a separate system message.
+        """
+        payload_messages = []
+        if system_prompt:
+            payload_messages.append({"role": "system", "content": system_prompt})
+        if dynamic_context:
+            payload_messages.append({"role": "system", "content": dynamic_context})
+        payload_messages.extend(messages)
+        return payload_messages
+
     async def stream_chat_completion(
         self,
         messages: list[dict],
-        system_prompt: str = None
+        system_prompt: str = None,
+        dynamic_context: str = None
     ) -> AsyncGenerator[str, None]:
         """
         Stream chat completion from OpenRouter.
 
         Yields tokens as they arrive for real-time streaming UX.
-        """
-        if system_prompt:
-            messages = [{"role": "system", "content": system_prompt}] + messages
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "HTTP-Referer": "https://github.com/teach-me-lebron",
-            "X-Title": "Teach Me LeBron - Sports Lore Chatbot",
-            "Content-Type": "application/json"
-        }
+        Args:
+            messages: Conversation messages (history and the new message)
+            system_prompt: Static system prompt; keep this constant so the
+                request prefix stays cacheable
+            dynamic_context: Optional per-request context, sent as a
+                separate system message after the static prompt
+        """
+        messages = self._build_messages(messages, system_prompt, dynamic_context)
 
-        payload = {
+        # Serialize with orjson ourselves instead of httpx's stdlib json
+        body = orjson.dumps({
             "model": self.model,
             "messages": messages,
             "stream": True,
-        }
+        })
 
         logger.debug(f"Starting streaming completion with {len(messages)} messages")
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=payload
-                ) as response:
-                    # Check for HTTP errors
-                    if response.status_code == 429:
-                        logger.error(f"Rate limit exceeded (429) for OpenRouter API. Model: {self.model}")
-                        raise httpx.HTTPStatusError(
-                            "Rate limit exceeded. Please try again in a moment.",
-                            request=response.request,
-                            response=response
-                        )
-                    elif response.status_code == 401:
-                        logger.error("Authentication failed (401) - Invalid API key")
-                        raise httpx.HTTPStatusError(
-                            "Invalid API key. Please check your OpenRouter credentials.",
-                            request=response.request,
-                            response=response
-                        )
-                    elif response.status_code >= 400:
-                        logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-                        response.raise_for_status()
-
-                    response.raise_for_status()
-                    logger.debug("Successfully connected to OpenRouter stream")
-
-                    token_count = 0
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            data = line[6:]  # Remove "data: " prefix
-
-                            if data == "[DONE]":
-                                logger.debug(f"Stream completed. Total tokens: {token_count}")
-                                break
-
-                            try:
-                                chunk = json.loads(data)
-                                if "choices" in chunk and len(chunk["choices"]) > 0:
-                                    delta = chunk["choices"][0].get("delta", {})
-                                    if "content" in delta:
-                                        token_count += 1
-                                        yield delta["content"]
-                            except json.JSONDecodeError as e:
-                                logger.warning(f"Failed to parse SSE chunk: {e}")
-                                continue
+            async with self.client.stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                headers=self._static_headers,
+                content=body,
+                timeout=60.0
+            ) as response:
+                if response.status_code >= 400:
+                    await self._raise_for(response)
+                logger.debug("Successfully connected to OpenRouter stream")
+
+                token_count = 0
+                async for data in self._iter_sse_data(response):
+                    if data == b"[DONE]":
+                        logger.debug(f"Stream completed. Total tokens: {token_count}")
+                        break
+
+                    try:
+                        chunk = orjson.loads(data)
+                        if "choices" in chunk and len(chunk["choices"]) > 0:
+                            delta = chunk["choices"][0].get("delta") or {}
+                            # Role-only and tool-call deltas carry null content
+                            content = delta.get("content")
+                            if content:
+                                token_count += 1
+                                yield content
+                    except orjson.JSONDecodeError as e:
+                        logger.warning(f"Failed to parse SSE chunk: {e}")
+                        continue
 
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error during streaming: {e.response.status_code} - {str(e)}")
@@ -105,64 +143,86 @@ class OpenRouterService:
             logger.error(f"Unexpected error during streaming: {str(e)}", exc_info=True)
             raise
 
+    async def _raise_for(self, response: httpx.Response):
+        """
+        Log an error response and raise the matching HTTPStatusError.
+
+        Only called for status codes >= 400, so successful responses skip
+        all of this.
+        """
+        known_error = _STATUS_ERRORS.get(response.status_code)
+        if known_error is not None:
+            log_message, error_message = known_error
+            logger.error(log_message.format(model=self.model))
+            raise httpx.HTTPStatusError(
+                error_message,
+                request=response.request,
+                response=response
+            )
+
+        # Streamed responses must be read before their body is available
+        await response.aread()
+        logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
+        response.raise_for_status()
+
+    @staticmethod
+    async def _iter_sse_data(response: httpx.Response) -> AsyncGenerator[bytes, None]:
+        """
+        Yield the payload of each `data:` line in an SSE response as bytes.
+
+        Works on raw bytes so non-data lines (keep-alive comments, blank
+        separators) are skipped without ever being decoded.
+        """
+        buffer = bytearray()
+        async for raw in response.aiter_bytes():
+            buffer.extend(raw)
+            while (newline := buffer.find(b"\n")) != -1:
+                line = bytes(buffer[:newline]).rstrip(b"\r")
+                del buffer[:newline + 1]
+                if line.startswith(b"data: "):
+                    yield line[6:]  # Remove "data: " prefix
+
+        # A final line without a trailing newline
+        line = bytes(buffer).rstrip(b"\r")
+        if line.startswith(b"data: "):
+            yield line[6:]
+
     async def get_chat_completion(
         self,
         messages: list[dict],
-        system_prompt: str = None
+        system_prompt: str = None,
+        dynamic_context: str = None
     ) -> str:
         """
         Get non-streaming chat completion from OpenRouter.
 
-        Returns the complete response.
+        Returns the complete response. Arguments are the same as for
+        stream_chat_completion.
         """
-        if system_prompt:
-            messages = [{"role": "system", "content": system_prompt}] + messages
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "HTTP-Referer": "https://github.com/teach-me-lebron",
-            "X-Title": "Teach Me LeBron - Sports Lore Chatbot",
-            "Content-Type": "application/json"
-        }
+        messages = self._build_messages(messages, system_prompt, dynamic_context)
 
-        payload = {
+        body = orjson.dumps({
             "model": self.model,
             "messages": messages,
             "stream": False,
-        }
+        })
 
         logger.debug(f"Requesting non-streaming completion with {len(messages)} messages")
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-
-                if response.status_code == 429:
-                    logger.error(f"Rate limit exceeded (429) for OpenRouter API. Model: {self.model}")
-                    raise httpx.HTTPStatusError(
-                        "Rate limit exceeded. Please try again in a moment.",
-                        request=response.request,
-                        response=response
-                    )
-                elif response.status_code == 401:
-                    logger.error("Authentication failed (401) - Invalid API key")
-                    raise httpx.HTTPStatusError(
-                        "Invalid API key. Please check your OpenRouter credentials.",
-                        request=response.request,
-                        response=response
-                    )
-                elif response.status_code >= 400:
-                    logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-
-                response.raise_for_status()
-                result = response.json()
-                content = result["choices"][0]["message"]["content"]
-                logger.debug(f"Received completion: {len(content)} characters")
-                return content
+            response = await self.client.post(
+                f"{self.base_url}/chat/completions",
+                headers=self._static_headers,
+                content=body,
+                timeout=60.0
+            )
+
+            if response.status_code >= 400:
+                await self._raise_for(response)
+            result = orjson.loads(response.content)
+            content = result["choices"][0]["message"]["content"]
+            logger.debug(f"Received completion: {len(content)} characters")
+            return content
 
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error: {e.response.status_code} - {str(e)}")
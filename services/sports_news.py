@@ -1,52 +1,152 @@
+import asyncio
 import httpx
-from typing import List
+import orjson
+import re
+import time
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from models import NewsItem, UserPreferences, TeamPreference
 from config import get_settings
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# League headlines are the same for every team, so each league's news feed
+# is fetched at most once per this many seconds
+_NEWS_TTL_SECONDS = 300
+
+# Only the newest articles in a league feed are scanned for team news
+_MAX_ARTICLES = 5
+
+# Headlines mentioning any of these are treated as playoff news
+_PLAYOFF_KEYWORDS = ("playoff", "championship", "finals", "wildcard")
+# One pass over the (already lowercased) headline instead of one per keyword
+_PLAYOFF_RE = re.compile("|".join(map(re.escape, _PLAYOFF_KEYWORDS)))
+
+# Importance levels worth surfacing to the user
+_IMPORTANT = frozenset({"playoff", "local"})
+
+# Map sport to ESPN league
+_LEAGUE_MAP = {
+    "baseball": "mlb",
+    "football": "nfl",
+    "basketball": "nba",
+    "hockey": "nhl"
+}
+
+# Team mappings for Seattle defaults
+_SEATTLE_TEAMS = {
+    "baseball": {
+        "name": "Seattle Mariners",
+        "id": "12",
+        "league": "mlb"
+    },
+    "football": {
+        "name": "Seattle Seahawks",
+        "id": "26",
+        "league": "nfl"
+    }
+}
+
+
+def _text(value) -> str:
+    """Return value if it is a string, else an empty string."""
+    return value if isinstance(value, str) else ""
+
+
+@lru_cache(maxsize=32)
+def _default_teams(location_key: str) -> Tuple[TeamPreference, ...]:
+    """Build the default teams for a lowercased location (frozen, so shareable)."""
+    if location_key == "seattle":
+        return (
+            TeamPreference(
+                team_name=_SEATTLE_TEAMS["baseball"]["name"],
+                team_id=_SEATTLE_TEAMS["baseball"]["id"],
+                sport="baseball",
+                is_local=True
+            ),
+            TeamPreference(
+                team_name=_SEATTLE_TEAMS["football"]["name"],
+                team_id=_SEATTLE_TEAMS["football"]["id"],
+                sport="football",
+                is_local=True
+            )
+        )
+
+    # For other locations, return empty (could expand this)
+    return ()
+
+
+@lru_cache(maxsize=32)
+def _default_preferences(location: str) -> UserPreferences:
+    """Default preferences for a location, as spelled by the caller."""
+    return UserPreferences(location=location, teams=list(_default_teams(location.lower())))
 
 
 class SportsNewsService:
     """Service for fetching sports news from ESPN API."""
 
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        """
+        Args:
+            client: Shared HTTP client to send requests through. A private
+                pooled HTTP/2 client is created (and owned) if none is given.
+        """
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50)
+        )
         self.settings = get_settings()
         self.base_url = self.settings.sports_api_base_url
 
-        # Team mappings for Seattle defaults
-        self.seattle_teams = {
-            "baseball": {
-                "name": "Seattle Mariners",
-                "id": "12",
-                "league": "mlb"
-            },
-            "football": {
-                "name": "Seattle Seahawks",
-                "id": "26",
-                "league": "nfl"
-            }
-        }
+        # League -> (fetched at, parsed news payload), with one lock per
+        # league so concurrent requests share a single fetch. This also caps
+        # in-flight ESPN requests at one per league in _LEAGUE_MAP.
+        self._news_cache: Dict[str, Tuple[float, dict]] = {}
+        self._news_locks: Dict[str, asyncio.Lock] = {}
+
+    async def aclose(self):
+        """Close the HTTP client if this service created it."""
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def _get_league_news(self, league: str) -> Optional[dict]:
+        """
+        Get a league's news payload, cached for _NEWS_TTL_SECONDS.
+
+        Returns None if ESPN doesn't answer with 200 (not cached).
+        """
+        cached = self._news_cache.get(league)
+        if cached is not None and time.monotonic() - cached[0] < _NEWS_TTL_SECONDS:
+            return cached[1]
+
+        lock = self._news_locks.setdefault(league, asyncio.Lock())
+        async with lock:
+            # Another request may have refreshed it while we waited
+            cached = self._news_cache.get(league)
+            if cached is not None and time.monotonic() - cached[0] < _NEWS_TTL_SECONDS:
+                return cached[1]
+
+            news_response = await self.client.get(f"{self.base_url}/{league}/news", timeout=30.0)
+            if news_response.status_code != 200:
+                return None
+
+            news_data = orjson.loads(news_response.content)
+            self._news_cache[league] = (time.monotonic(), news_data)
+            return news_data
 
     def get_default_preferences(self, location: str = "Seattle") -> UserPreferences:
-        """Get default team preferences for a location."""
-        if location.lower() == "seattle":
-            teams = [
-                TeamPreference(
-                    team_name=self.seattle_teams["baseball"]["name"],
-                    team_id=self.seattle_teams["baseball"]["id"],
-                    sport="baseball",
-                    is_local=True
-                ),
-                TeamPreference(
-                    team_name=self.seattle_teams["football"]["name"],
-                    team_id=self.seattle_teams["football"]["id"],
-                    sport="football",
-                    is_local=True
-                )
-            ]
-            return UserPreferences(location=location, teams=teams)
-
-        # For other locations, return empty (could expand this)
-        return UserPreferences(location=location, teams=[])
+        """
+        Get default team preferences for a location.
+
+        Results are cached per location, so callers must treat the returned
+        preferences as read-only.
+        """
+        return _default_preferences(location)
 
     async def fetch_team_news(
         self,
@@ -55,63 +155,64 @@ class SportsNewsService:
         team_name: str,
         is_local: bool = False
     ) -> List[NewsItem]:
-        """Fetch news for a specific team."""
-        news_items = []
+        """
+        Fetch news for a specific team.
 
-        # Map sport to ESPN league
-        league_map = {
-            "baseball": "mlb",
-            "football": "nfl",
-            "basketball": "nba",
-            "hockey": "nhl"
-        }
+        Team news is picked out of the league's headlines by name; team_id
+        is not needed for that and is currently unused.
+        """
+        news_items = []
 
-        league = league_map.get(sport.lower())
+        league = _LEAGUE_MAP.get(sport.lower())
         if not league:
             return news_items
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                # Fetch team info and recent games
-                url = f"{self.base_url}/{league}/teams/{team_id}"
-                response = await client.get(url)
-                response.raise_for_status()
-                data = response.json()
-
-                # Check for playoffs or important games
-                team_data = data.get("team", {})
-
-                # Fetch recent news/headlines
-                news_url = f"{self.base_url}/{league}/news"
-                news_response = await client.get(news_url)
-
-                if news_response.status_code == 200:
-                    news_data = news_response.json()
-                    articles = news_data.get("articles", [])[:5]
-
-                    for article in articles:
-                        # Filter for team-related news
-                        headline = article.get("headline", "")
-                        description = article.get("description", "")
-
-                        if team_name.lower() in headline.lower() or team_name.lower() in description.lower():
-                            # Determine importance
-                            importance = "local" if is_local else "general"
-                            if any(keyword in headline.lower() for keyword in ["playoff", "championship", "finals", "wildcard"]):
-                                importance = "playoff"
-
-                            news_items.append(NewsItem(
-                                title=headline,
-                                description=description,
-                                team=team_name,
-                                sport=sport,
-                                importance=importance,
-                                link=article.get("links", {}).get("web", {}).get("href"),
-                                published=article.get("published")
-                            ))
-
-            except Exception as e:
-                print(f"Error fetching news for {team_name}: {e}")
+        try:
+            # Fetch recent news/headlines
+            news_data = await self._get_league_news(league)
+
+            if news_data is not None:
+                team_lc = team_name.lower()
+
+                for article in islice(news_data.get("articles") or (), _MAX_ARTICLES):
+                    # Filter for team-related news (ESPN sends null for some
+                    # fields; anything that isn't a string is treated as empty)
+                    headline = _text(article.get("headline"))
+                    description = _text(article.get("description"))
+                    headline_lc = headline.lower()
+
+                    # The description is only lowercased if the headline misses
+                    if team_lc in headline_lc or team_lc in description.lower():
+                        # Determine importance
+                        importance = "local" if is_local else "general"
+                        if _PLAYOFF_RE.search(headline_lc) is not None:
+                            importance = "playoff"
+
+                        try:
+                            link = article["links"]["web"]["href"]
+                        except (KeyError, TypeError):
+                            link = None
+                        if not isinstance(link, str):
+                            link = None
+                        published = article.get("published")
+                        if not isinstance(published, str):
+                            published = None
+
+                        # Every field now has the type NewsItem declares, so
+                        # pydantic validation can be skipped
+                        news_items.append(NewsItem.model_construct(
+                            title=headline,
+                            description=description,
+                            team=team_name,
+                            sport=sport,
+                            importance=importance,
+                            link=link,
+                            published=published
+                        ))
+
+        except (httpx.HTTPError, ValueError):
+            # ValueError covers malformed JSON (orjson.JSONDecodeError)
+            logger.exception("Error fetching news for %s", team_name)
 
         return news_items
 
@@ -124,27 +225,44 @@ class SportsNewsService:
 
         Only returns playoff news or local team news.
         """
+        # Fetch every team's news concurrently
+        results = await asyncio.gather(
+            *self._team_news_fetches(preferences),
+            return_exceptions=True
+        )
+
         all_news = []
+        for team, team_news in zip(preferences.teams, results):
+            if isinstance(team_news, BaseException):
+                logger.error("Unexpected error fetching news for %s", team.team_name, exc_info=team_news)
+                continue
+            all_news.extend(team_news)
+
+        return self._select_important(all_news)
 
-        for team in preferences.teams:
-            team_news = await self.fetch_team_news(
+    def _team_news_fetches(self, preferences: UserPreferences) -> list:
+        """Create one fetch_team_news coroutine per followed team."""
+        return [
+            self.fetch_team_news(
                 sport=team.sport,
                 team_id=team.team_id,
                 team_name=team.team_name,
                 is_local=team.is_local
             )
-            all_news.extend(team_news)
+            for team in preferences.teams
+        ]
 
+    @staticmethod
+    def _select_important(all_news: List[NewsItem]) -> List[NewsItem]:
+        """Keep playoff and local news only, playoff first, top 5 items."""
         # Filter to only important news (playoff or local)
         important_news = [
             news for news in all_news
-            if news.importance in ["playoff", "local"]
+            if news.importance in _IMPORTANT
         ]
 
         # Sort by importance (playoff first) and limit
-        important_news.sort(
-            key=lambda x: (0 if x.importance == "playoff" else 1)
-        )
+        important_news.sort(key=lambda x: x.importance != "playoff")
 
         return important_news[:5]  # Limit to top 5 items
 
@@ -155,13 +273,32 @@ class SportsNewsService:
         """
         Check if there's important news worth proactively sharing.
 
+        Only playoff news triggers a notification, so team fetches are
+        consumed as they complete and the rest are cancelled as soon as one
+        turns up a playoff item. The returned items are whatever important
+        news had arrived by then.
+
         Returns: (should_notify, news_items)
         """
-        news = await self.get_important_news(preferences)
+        tasks = [asyncio.ensure_future(fetch) for fetch in self._team_news_fetches(preferences)]
+        all_news = []
+        should_notify = False
 
-        # Only proactively notify if there's playoff news or significant local news
-        should_notify = len(news) > 0 and any(
-            item.importance == "playoff" for item in news
-        )
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    team_news = await next_done
+                except Exception:
+                    logger.exception("Unexpected error fetching team news")
+                    continue
+
+                all_news.extend(team_news)
+                if any(item.importance == "playoff" for item in team_news):
+                    should_notify = True
+                    break
+        finally:
+            # No-op for finished fetches
+            for task in tasks:
+                task.cancel()
 
-        return should_notify, news
+        return should_notify, self._select_important(all_news)